@@ -3,14 +3,21 @@ import plotly.express as px
 import streamlit as st
 import datetime as dt
 from db_utils import connect_to_firebase_db_and_authenticate, get_all_reservations
+from campground_map import (
+    BANNER_IMAGE,
+    BANNER_WIDTH,
+    PLAN_IMAGE,
+    PLAN_WIDTH,
+    get_downscaled_image,
+)
 
 st.sidebar.title("Reservation System")
 _, img_col, _ = st.columns((1, 2, 1))
 st.header("Reservation System")
-img_col.image("playa_norte.png")
+img_col.image(get_downscaled_image(BANNER_IMAGE, BANNER_WIDTH))
 
 with st.expander("Campground Plan"):
-    st.image("campground.png")
+    st.image(get_downscaled_image(PLAN_IMAGE, PLAN_WIDTH))
 
 st.subheader("View Reservations")
 _, col11, _, col12, _ = st.columns((1, 4, 1, 8, 1))
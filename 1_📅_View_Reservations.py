@@ -2,19 +2,23 @@ import pandas as pd
 import plotly.express as px
 import streamlit as st
 import datetime as dt
-from db_manager import DBManager
+from db_manager import get_db_manager
+from campground_map import (
+    BANNER_IMAGE,
+    BANNER_WIDTH,
+    get_downscaled_image,
+    render_availability_map,
+)
+from utils import debounce, get_occupied_sites
 
 if "db" not in st.session_state.keys():
-    db = DBManager()
-    st.session_state["db"] = db
+    st.session_state["db"] = get_db_manager()
 
 if "authenticated" not in st.session_state.keys():
     st.session_state["authenticated"] = False
 
 st.sidebar.title("Reservation System")
 refresh = st.sidebar.button("Refresh Data")
-if refresh:
-    st.session_state["db"] = DBManager()
 st.sidebar.header("Administrators Login")
 
 if not st.session_state["authenticated"]:
@@ -30,20 +34,25 @@ if not st.session_state["authenticated"]:
 else:
     st.sidebar.success("Logged in as administrator.")
 
-if "all_reservations" not in st.session_state.keys() or refresh:
-    with st.spinner("Loading database ..."):
-        st.session_state["db"] = DBManager()
-        st.session_state["all_reservations"] = st.session_state[
-            "db"
-        ].get_all_reservations()
+with st.spinner("Loading database ..."):
+    if refresh and debounce(st.session_state, "last_refresh"):
+        st.session_state["db"].refresh_reservations()
+    st.session_state["all_reservations"] = st.session_state[
+        "db"
+    ].get_cached_reservations()
 
 _, img_col, _ = st.columns((1, 2, 1))
 st.header("📅 View Reservations")
-img_col.image("playa_norte.png")
+img_col.image(get_downscaled_image(BANNER_IMAGE, BANNER_WIDTH))
 
 
 with st.expander("Campground Plan"):
-    st.image("campground.png")
+    map_date = st.date_input("Availability on", dt.datetime.now(), key="map_date")
+    occupied_sites = get_occupied_sites(st.session_state["all_reservations"], map_date)
+    st.image(
+        render_availability_map(frozenset(occupied_sites)),
+        caption="Green sites are free, red sites are occupied on the selected night.",
+    )
 
 
 st.subheader("View Existing Reservations")
@@ -0,0 +1,109 @@
+import bisect
+import datetime as dt
+
+from utils import get_site_types
+
+# Leftover gaps this short (in nights) are considered unsellable
+MAX_UNSELLABLE_GAP = 3
+UNSELLABLE_GAP_COST = 1000
+OPEN_GAP_COST = 1.5
+
+
+def assign_sites(requests: list, all_reservations: dict, site_types: dict = None) -> list:
+    """Assigns a concrete site to each requested stay, minimizing fragmentation.
+
+    Requests are placed in order of arrival date, longest first, each on the
+    site of its type where it fits the free interval best: stays that close a
+    gap exactly are preferred, stays that would leave an unsellable gap of
+    1 to MAX_UNSELLABLE_GAP nights are avoided, and among the others the
+    tightest free interval wins, keeping long free stretches for long stays.
+
+    Args:
+        requests (list): Dictionaries with a "site_type" (e.g. "A" or "Others"),
+            a "start" and an "end" date.
+        all_reservations (dict): Nested dictionary of all reservation instances.
+        site_types (dict, optional): Site name to site type. Defaults to get_site_types().
+
+    Returns:
+        sites: Assigned site name for each request, in the order of the requests,
+            None for requests that cannot be placed.
+    """
+    if site_types is None:
+        site_types = get_site_types()
+    sites_by_type = {}
+    for site, site_type in site_types.items():
+        sites_by_type.setdefault(site_type, []).append(site)
+    schedules = {
+        site: _Schedule(all_reservations.get(site)) for site in site_types
+    }
+
+    order = sorted(
+        range(len(requests)),
+        key=lambda i: (requests[i]["start"], requests[i]["start"] - requests[i]["end"]),
+    )
+    assigned = [None] * len(requests)
+    for i in order:
+        start = requests[i]["start"].toordinal()
+        end = requests[i]["end"].toordinal()
+        if end <= start:
+            continue
+        best_cost = None
+        for site in sites_by_type.get(requests[i]["site_type"], []):
+            gaps = schedules[site].gaps_around(start, end)
+            if gaps is None:
+                continue
+            cost = _gap_cost(gaps[0]) + _gap_cost(gaps[1])
+            if best_cost is None or cost < best_cost:
+                best_cost, assigned[i] = cost, site
+        if assigned[i] is not None:
+            schedules[assigned[i]].add(start, end)
+    return assigned
+
+
+class _Schedule:
+    """Sorted, non-overlapping occupied intervals of one site, as day ordinals."""
+
+    def __init__(self, site_reservations: dict):
+        intervals = sorted(
+            (
+                dt.date.fromisoformat(start).toordinal(),
+                dt.date.fromisoformat(reservation["end"]).toordinal(),
+            )
+            for start, reservation in (site_reservations or {}).items()
+        )
+        # Legacy data may hold overlapping reservations, merge them
+        self.starts, self.ends = [], []
+        for start, end in intervals:
+            if self.ends and start < self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def gaps_around(self, start: int, end: int) -> tuple:
+        """Returns the free nights left before and after a stay, None if it does not fit."""
+        i = bisect.bisect_right(self.starts, start)
+        previous_end = self.ends[i - 1] if i > 0 else None
+        next_start = self.starts[i] if i < len(self.starts) else None
+        if (previous_end is not None and previous_end > start) or (
+            next_start is not None and next_start < end
+        ):
+            return None
+        before = start - previous_end if previous_end is not None else None
+        after = next_start - end if next_start is not None else None
+        return before, after
+
+    def add(self, start: int, end: int):
+        i = bisect.bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+
+
+def _gap_cost(gap: int) -> float:
+    if gap is None:
+        return OPEN_GAP_COST
+    if gap == 0:
+        return 0
+    if gap <= MAX_UNSELLABLE_GAP:
+        return UNSELLABLE_GAP_COST
+    return 1 + gap / 1000
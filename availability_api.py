@@ -0,0 +1,252 @@
+"""Read-only HTTP/JSON availability endpoint, served next to the Streamlit app.
+
+Answers per-type availability and occupancy for a date window from the shared
+reservation cache (RESERVATION_CACHE_URL=redis://...) or, without one, from the
+on-disk snapshot written by DBManager. It never touches Firestore.
+
+    python availability_api.py --port 8502
+    curl "http://localhost:8502/availability?start=2024-01-01&end=2024-01-31&type=A"
+
+Responses carry an ETag, conditional requests with a matching If-None-Match get
+a 304, and payloads are computed once per snapshot version and window. While
+the reservations of some sites are not known, the endpoint answers 503.
+"""
+import argparse
+import datetime as dt
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from reservation_cache import RedisReservationCache, get_reservation_cache
+from reservation_snapshot import get_snapshot_path, read_snapshot
+from utils import get_site_types, is_reservation_possible
+
+MAX_WINDOW_DAYS = 366
+MAX_CACHED_PAYLOADS = 256
+
+
+class ReservationsUnavailable(Exception):
+    """Raised when the reservations of some reservable sites are not known."""
+
+
+class AvailabilityIndex:
+    """Reservations of one snapshot version, indexed by site type and night."""
+
+    def __init__(self, reservations: dict, version: str):
+        self.version = version
+        self.reservations = reservations
+        self.site_types = get_site_types()
+        self.sites_by_type = {}
+        for site, site_type in self.site_types.items():
+            self.sites_by_type.setdefault(site_type, []).append(site)
+        # Number of occupied sites per type and night
+        self.occupied = {site_type: {} for site_type in self.sites_by_type}
+        for site, site_reservations in reservations.items():
+            if site not in self.site_types:
+                continue
+            counts = self.occupied[self.site_types[site]]
+            for start, reservation in (site_reservations or {}).items():
+                night = dt.date.fromisoformat(start)
+                end = dt.date.fromisoformat(reservation["end"])
+                while night < end:
+                    counts[night] = counts.get(night, 0) + 1
+                    night += dt.timedelta(days=1)
+
+    def availability(self, start: dt.date, end: dt.date, site_type: str = None) -> dict:
+        """Returns free/occupied counts per night, occupancy and fully free sites per type.
+
+        Args:
+            start (dt.date): First night of the window.
+            end (dt.date): Day after the last night of the window.
+            site_type (str, optional): Restrict to one site type. Defaults to all.
+
+        Returns:
+            payload: JSON-serializable dictionary.
+        """
+        nights = [start + dt.timedelta(days=i) for i in range((end - start).days)]
+        reservation = {start.isoformat(): {"end": end.isoformat()}}
+        types = [site_type] if site_type else sorted(self.sites_by_type)
+        payload = dict(
+            version=self.version,
+            start=start.isoformat(),
+            end=end.isoformat(),
+            site_types={},
+        )
+        for name in types:
+            sites = self.sites_by_type[name]
+            counts = self.occupied[name]
+            occupied_nights = sum(counts.get(night, 0) for night in nights)
+            payload["site_types"][name] = dict(
+                sites=len(sites),
+                occupancy=round(occupied_nights / (len(sites) * len(nights)), 4),
+                free_sites=[
+                    site
+                    for site in sites
+                    if is_reservation_possible(self.reservations.get(site), reservation)
+                ],
+                nights={
+                    night.isoformat(): dict(
+                        occupied=counts.get(night, 0),
+                        free=len(sites) - counts.get(night, 0),
+                    )
+                    for night in nights
+                },
+            )
+        return payload
+
+
+class ReservationSource:
+    """Keeps an AvailabilityIndex in sync with the shared cache or the snapshot file."""
+
+    def __init__(self, cache=None, snapshot_path: str = None):
+        self.cache = cache
+        self.snapshot_path = snapshot_path or get_snapshot_path()
+        self._lock = threading.Lock()
+        self._cache_version = 0
+        self._entries = {}
+        self._index = AvailabilityIndex({}, "0")
+        self._payloads = OrderedDict()
+
+    def get_index(self) -> AvailabilityIndex:
+        with self._lock:
+            version = self._current_version()
+            if version != self._index.version:
+                self._index = AvailabilityIndex(self._load(version), version)
+                self._payloads.clear()
+            return self._index
+
+    def get_payload(self, start: dt.date, end: dt.date, site_type: str) -> tuple:
+        """Returns the (etag, body) of a window, computed once per snapshot version."""
+        index = self.get_index()
+        key = (index.version, start, end, site_type)
+        with self._lock:
+            if key in self._payloads:
+                self._payloads.move_to_end(key)
+                return self._payloads[key]
+        body = json.dumps(index.availability(start, end, site_type)).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        with self._lock:
+            if index.version == self._index.version:
+                self._payloads[key] = (etag, body)
+                while len(self._payloads) > MAX_CACHED_PAYLOADS:
+                    self._payloads.popitem(last=False)
+        return etag, body
+
+    def _current_version(self) -> str:
+        if self.cache is not None:
+            return str(self.cache.get_version())
+        if not os.path.exists(self.snapshot_path):
+            return "0"
+        stat = os.stat(self.snapshot_path)
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    def _load(self, version: str) -> dict:
+        reservations, known = {}, set()
+        if self.cache is not None:
+            # Pull only the sites invalidated since the previous version
+            site_names = self.cache.get_invalidations(self._cache_version)
+            entries = self.cache.get_sites(site_names)
+            if site_names is None:
+                self._entries = entries
+            else:
+                self._entries = {**self._entries, **entries}
+            self._cache_version = int(version)
+            reservations = {
+                site: e["reservations"]
+                for site, e in self._entries.items()
+                if not e.get("deleted")
+            }
+            known = set(self._entries)
+        # The cache only holds the sites published since it was started, the
+        # others come from the snapshot, a full copy of the sites collection
+        if not set(get_site_types()) <= known:
+            snapshot = read_snapshot(self.snapshot_path)
+            if snapshot is None:
+                raise ReservationsUnavailable("Reservations are not available yet.")
+            for site, site_reservations in snapshot[0].items():
+                if site not in known:
+                    reservations[site] = site_reservations
+        return reservations
+
+
+class AvailabilityHandler(BaseHTTPRequestHandler):
+    source = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/availability":
+            return self._send_json(404, {"error": "Not found."})
+        try:
+            start, end, site_type = self._parse_query(parse_qs(url.query))
+            etag, body = self.source.get_payload(start, end, site_type)
+        except ValueError as e:
+            return self._send_json(400, {"error": str(e)})
+        except ReservationsUnavailable as e:
+            return self._send_json(503, {"error": str(e)})
+
+        if self._etag_matches(etag):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "public, max-age=30")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _etag_matches(self, etag: str) -> bool:
+        # If-None-Match holds "*" or a comma separated list of, possibly weak, tags
+        for tag in self.headers.get("If-None-Match", "").split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag in ("*", etag):
+                return True
+        return False
+
+    def _parse_query(self, query: dict) -> tuple:
+        today = dt.date.today()
+        start = dt.date.fromisoformat(query.get("start", [today.isoformat()])[0])
+        end = query.get("end", [None])[0]
+        end = dt.date.fromisoformat(end) if end else start + dt.timedelta(days=30)
+        if not 0 < (end - start).days <= MAX_WINDOW_DAYS:
+            raise ValueError(f"end must be 1 to {MAX_WINDOW_DAYS} days after start.")
+        site_type = query.get("type", [None])[0]
+        if site_type and site_type not in self.source.get_index().sites_by_type:
+            raise ValueError(f"Unknown site type: {site_type}")
+        return start, end, site_type
+
+    def _send_json(self, status: int, data: dict):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    args = parser.parse_args()
+
+    # Only a Redis tier is shared with the app, the in-process stand-in is not
+    cache = get_reservation_cache()
+    if not isinstance(cache, RedisReservationCache):
+        cache = None
+    AvailabilityHandler.source = ReservationSource(cache=cache)
+    server = ThreadingHTTPServer((args.host, args.port), AvailabilityHandler)
+    print(f"Serving availability on http://{args.host}:{args.port}/availability")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
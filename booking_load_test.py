@@ -0,0 +1,329 @@
+"""Correctness and load harness for the booking path.
+
+Checks `is_reservation_possible` against a night-by-night oracle on edge cases
+and on randomly generated schedules, then runs many concurrent admin sessions
+(validate_reservation_is_possible followed by add_reservation_to_site) against
+an in-memory stand-in for Firestore. Sessions are spread over several
+DBManager replicas sharing a LocalReservationCache. The run fails if any site
+ends up double-booked, and reports throughput and p50/p99 booking latency.
+
+    python booking_load_test.py --sessions 16 --bookings 100 --seed 0
+"""
+import argparse
+import copy
+import datetime as dt
+import random
+import sys
+import threading
+import time
+import types
+
+from google.api_core.exceptions import FailedPrecondition, NotFound
+from google.cloud import firestore
+
+from db_manager import DBManager
+from reservation_cache import LocalReservationCache
+from utils import get_reservable_sites, is_reservation_possible
+
+FIRST_DAY = dt.date(2024, 1, 1)
+
+
+class InMemoryFirestore:
+    """Thread-safe stand-in for the subset of the Firestore client used by DBManager.
+
+    Each call sleeps for `rpc_latency` seconds before touching the data, so
+    concurrent sessions interleave the way they would over the network.
+    """
+
+    def __init__(self, rpc_latency: float = 0.0):
+        self.rpc_latency = rpc_latency
+        self.lock = threading.Lock()
+        self.documents = {}
+        self._last_time = dt.datetime.now(dt.timezone.utc)
+
+    def collection(self, collection_name: str):
+        return _CollectionReference(self, collection_name)
+
+    def get_all(self, references: list):
+        self._wait()
+        with self.lock:
+            return [self._snapshot(r.collection_name, r.id) for r in references]
+
+    def write_option(self, last_update_time: dt.datetime = None):
+        return types.SimpleNamespace(last_update_time=last_update_time)
+
+    def _wait(self):
+        if self.rpc_latency:
+            time.sleep(self.rpc_latency)
+
+    def _next_time(self) -> dt.datetime:
+        # Strictly increasing, microsecond precision like Firestore
+        self._last_time = max(
+            dt.datetime.now(dt.timezone.utc),
+            self._last_time + dt.timedelta(microseconds=1),
+        )
+        return self._last_time
+
+    def _snapshot(self, collection_name: str, object_name: str):
+        data, update_time = self.documents.get(
+            (collection_name, object_name), (None, None)
+        )
+        return types.SimpleNamespace(
+            id=object_name,
+            update_time=update_time,
+            to_dict=lambda: copy.deepcopy(data),
+        )
+
+
+class _DocumentReference:
+    def __init__(self, store: InMemoryFirestore, collection_name: str, object_name: str):
+        self.store = store
+        self.collection_name = collection_name
+        self.id = object_name
+
+    def get(self):
+        self.store._wait()
+        with self.store.lock:
+            return self.store._snapshot(self.collection_name, self.id)
+
+    def set(self, data: dict):
+        self.store._wait()
+        with self.store.lock:
+            update_time = self.store._next_time()
+            self.store.documents[(self.collection_name, self.id)] = (
+                copy.deepcopy(data),
+                update_time,
+            )
+            return types.SimpleNamespace(update_time=update_time)
+
+    def update(self, new_data: dict, option=None):
+        self.store._wait()
+        with self.store.lock:
+            key = (self.collection_name, self.id)
+            if key not in self.store.documents:
+                raise NotFound(f"No document {self.id}")
+            data, update_time = self.store.documents[key]
+            if option is not None and option.last_update_time != update_time:
+                raise FailedPrecondition(f"Document {self.id} changed")
+            data = copy.deepcopy(data)
+            for field, value in new_data.items():
+                if value is firestore.DELETE_FIELD:
+                    data.pop(field, None)
+                else:
+                    data[field] = copy.deepcopy(value)
+            update_time = self.store._next_time()
+            self.store.documents[key] = (data, update_time)
+            return types.SimpleNamespace(update_time=update_time)
+
+
+class _CollectionReference:
+    def __init__(self, store: InMemoryFirestore, collection_name: str):
+        self.store = store
+        self.collection_name = collection_name
+
+    def document(self, object_name: str):
+        return _DocumentReference(self.store, self.collection_name, object_name)
+
+    def select(self, field_paths: list):
+        return self
+
+    def stream(self):
+        self.store._wait()
+        with self.store.lock:
+            names = [o for c, o in self.store.documents if c == self.collection_name]
+            return [self.store._snapshot(self.collection_name, o) for o in names]
+
+
+def make_reservation(start: dt.date, nights: int, name: str) -> dict:
+    end = start + dt.timedelta(days=nights)
+    return {
+        start.strftime("%Y-%m-%d"): {
+            "name": name,
+            "start": start.strftime("%Y-%m-%d"),
+            "end": end.strftime("%Y-%m-%d"),
+            "duration": nights,
+            "color": "blue",
+        }
+    }
+
+
+def occupied_nights(reservation: dict) -> set:
+    """Oracle: the set of nights a reservation occupies, computed day by day."""
+    details = list(reservation.values())[0]
+    day = dt.date.fromisoformat(details["start"])
+    end = dt.date.fromisoformat(details["end"])
+    nights = set()
+    while day < end:
+        nights.add(day)
+        day += dt.timedelta(days=1)
+    return nights
+
+
+def oracle_is_possible(reservations: dict, reservation: dict) -> bool:
+    nights = occupied_nights(reservation)
+    return all(
+        not nights & occupied_nights({k: v}) for k, v in reservations.items()
+    )
+
+
+def check_edge_cases() -> list:
+    existing = make_reservation(FIRST_DAY + dt.timedelta(days=10), 5, "existing")
+    cases = {
+        "same-day turnover": (15, 3),
+        "back-to-back before": (7, 3),
+        "full containment": (8, 10),
+        "contained": (11, 2),
+        "identical": (10, 5),
+        "overlapping start": (12, 5),
+        "overlapping end": (8, 3),
+        "one night before": (9, 1),
+        "one night inside": (14, 1),
+    }
+    failures = []
+    for label, (offset, nights) in cases.items():
+        candidate = make_reservation(FIRST_DAY + dt.timedelta(days=offset), nights, label)
+        expected = oracle_is_possible(existing, candidate)
+        if is_reservation_possible(existing, candidate) != expected:
+            failures.append(f"{label}: expected {expected}")
+    return failures
+
+
+def check_generated_schedules(rng: random.Random, schedules: int) -> list:
+    """Builds random non-overlapping schedules, then compares the check and the oracle."""
+    failures = []
+    for _ in range(schedules):
+        existing = {}
+        for _ in range(rng.randint(0, 12)):
+            candidate = random_reservation(rng, horizon=90)
+            if oracle_is_possible(existing, candidate):
+                existing.update(candidate)
+        candidate = random_reservation(rng, horizon=90)
+        expected = oracle_is_possible(existing, candidate)
+        if is_reservation_possible(existing, candidate) != expected:
+            failures.append(f"{sorted(existing)} + {list(candidate)}: expected {expected}")
+    return failures
+
+
+def random_reservation(rng: random.Random, horizon: int, name: str = "guest") -> dict:
+    start = FIRST_DAY + dt.timedelta(days=rng.randrange(horizon))
+    nights = rng.choice([1, 1, 2, 3, 4, 7, 14, 30])
+    return make_reservation(start, nights, name)
+
+
+def run_sessions(args, store: InMemoryFirestore, sites: list) -> dict:
+    cache = LocalReservationCache()
+    replicas = [DBManager(cache=cache, db=store) for _ in range(args.replicas)]
+    for db in replicas:
+        db.get_cached_reservations()
+
+    latencies, outcomes = [], {"accepted": 0, "unavailable": 0, "conflict": 0}
+    accepted = []
+    results_lock = threading.Lock()
+
+    def session(index: int):
+        rng = random.Random(args.seed * 1000 + index)
+        db = replicas[index % len(replicas)]
+        for i in range(args.bookings):
+            site = rng.choice(sites)
+            reservation = random_reservation(rng, args.horizon, f"s{index}-{i}")
+            started = time.perf_counter()
+            try:
+                if not db.validate_reservation_is_possible(site, reservation):
+                    outcome = "unavailable"
+                else:
+                    db.add_reservation_to_site(site, reservation)
+                    outcome = "accepted"
+            except FailedPrecondition:
+                outcome = "conflict"
+            except ValueError:
+                outcome = "unavailable"
+            elapsed = time.perf_counter() - started
+            with results_lock:
+                latencies.append(elapsed)
+                outcomes[outcome] += 1
+                if outcome == "accepted":
+                    accepted.append((site, reservation))
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(args.sessions)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+    return dict(
+        latencies=sorted(latencies),
+        outcomes=outcomes,
+        accepted=accepted,
+        duration=duration,
+        replicas=replicas,
+    )
+
+
+def check_no_double_booking(store: InMemoryFirestore, accepted: list) -> list:
+    failures = []
+    for (collection_name, site), (data, _) in store.documents.items():
+        if collection_name != "sites":
+            continue
+        seen = set()
+        for key, details in sorted(data.items()):
+            nights = occupied_nights({key: details})
+            if nights & seen:
+                failures.append(f"{site}: {key} overlaps another reservation")
+            seen |= nights
+    for site, reservation in accepted:
+        key, details = list(reservation.items())[0]
+        stored = store.documents[("sites", site)][0].get(key)
+        if stored != details:
+            failures.append(f"{site}: accepted reservation {key} was lost")
+    return failures
+
+
+def percentile(values: list, q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, default=16)
+    parser.add_argument("--replicas", type=int, default=2)
+    parser.add_argument("--bookings", type=int, default=100, help="per session")
+    parser.add_argument("--sites", type=int, default=8, help="contended sites")
+    parser.add_argument("--horizon", type=int, default=120, help="days")
+    parser.add_argument("--schedules", type=int, default=2000)
+    parser.add_argument("--rpc-latency", type=float, default=2.0, help="ms")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    failures = check_edge_cases()
+    failures += check_generated_schedules(random.Random(args.seed), args.schedules)
+    print(f"Overlap check: {len(failures)} failure(s) over edge cases and {args.schedules} schedules")
+
+    store = InMemoryFirestore()
+    all_sites = [s for v in get_reservable_sites().values() for s in v]
+    for site in all_sites:
+        store.collection("sites").document(site).set({})
+    store.rpc_latency = args.rpc_latency / 1000
+
+    results = run_sessions(args, store, all_sites[: args.sites])
+    booking_failures = check_no_double_booking(store, results["accepted"])
+    failures += booking_failures
+
+    latencies = results["latencies"]
+    print(
+        f"Bookings: {len(latencies)} attempts by {args.sessions} sessions on "
+        f"{args.replicas} replicas, {results['outcomes']}"
+    )
+    print(
+        f"Throughput: {len(latencies) / results['duration']:.1f} bookings/s, "
+        f"latency p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+        f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms"
+    )
+    print(f"No double booking: {'OK' if not booking_failures else 'FAILED'}")
+    for failure in failures[:20]:
+        print("  -", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import io
+import os
+
+import streamlit as st
+from PIL import Image, ImageDraw
+
+from utils import get_site_coordinates
+
+BANNER_IMAGE = "playa_norte.png"
+PLAN_IMAGE = "campground.png"
+BANNER_WIDTH = 800
+PLAN_WIDTH = 900
+
+FREE_COLOR = (46, 160, 67, 220)
+OCCUPIED_COLOR = (218, 54, 51, 220)
+
+
+@st.cache_resource
+def load_base_image(path: str, max_width: int) -> Image.Image:
+    """Loads an image once per process and downscales it to a maximum width.
+
+    Args:
+        path (str): Image file path.
+        max_width (int): Maximum width in pixels, the aspect ratio is kept.
+
+    Returns:
+        image: RGBA image. A blank plan is returned if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return Image.new("RGBA", (max_width, int(max_width * 0.6)), (237, 226, 200, 255))
+    image = Image.open(path).convert("RGBA")
+    if image.width > max_width:
+        height = int(image.height * max_width / image.width)
+        image = image.resize((max_width, height), Image.LANCZOS)
+    return image
+
+
+@st.cache_data
+def get_downscaled_image(path: str, max_width: int) -> bytes:
+    """Returns a downscaled copy of an image as PNG bytes, for st.image."""
+    return _to_png_bytes(load_base_image(path, max_width))
+
+
+@st.cache_data(max_entries=64)
+def render_availability_map(occupied_sites: frozenset, max_width: int = PLAN_WIDTH) -> bytes:
+    """Draws the per-site availability overlay on top of the cached campground plan.
+
+    Only the marker layer is drawn per call, the downscaled plan is shared, and
+    results are cached per set of occupied sites.
+
+    Args:
+        occupied_sites (frozenset): Names of the sites occupied on the chosen night.
+        max_width (int, optional): Width of the rendered plan. Defaults to PLAN_WIDTH.
+
+    Returns:
+        image: PNG bytes of the plan with a green (free) or red (occupied) marker per site.
+    """
+    base = load_base_image(PLAN_IMAGE, max_width)
+    overlay = Image.new("RGBA", base.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    radius = max(4, base.width // 90)
+    for site, (x, y) in get_site_coordinates().items():
+        cx, cy = x * base.width, y * base.height
+        color = OCCUPIED_COLOR if site in occupied_sites else FREE_COLOR
+        draw.ellipse(
+            (cx - radius, cy - radius, cx + radius, cy + radius),
+            fill=color,
+            outline=(255, 255, 255, 255),
+        )
+        draw.text((cx + radius + 2, cy - radius), site.split(" ")[0], fill=(0, 0, 0, 255))
+    return _to_png_bytes(Image.alpha_composite(base, overlay))
+
+
+def _to_png_bytes(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
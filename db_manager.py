@@ -1,11 +1,29 @@
 import datetime as dt
 import json
+import logging
 import os
+import threading
+import time
 
 import streamlit as st
+from google.api_core.exceptions import FailedPrecondition
 from google.cloud import firestore
 from google.oauth2 import service_account
 
+from pricing import RateTable
+from reservation_cache import (
+    format_update_time,
+    get_reservation_cache,
+    parse_update_time,
+)
+from reservation_snapshot import get_snapshot_path, read_snapshot, write_snapshot
+from utils import get_site_types, is_reservation_possible
+
+logger = logging.getLogger(__name__)
+
+# Refreshes completed less than this many seconds ago are reused
+MIN_REFRESH_INTERVAL = 5
+
 
 def refresh_db(fn, threshold=60):
     def wrapper(*args, **kwargs):
@@ -25,67 +43,293 @@ def refresh_db(fn, threshold=60):
     return wrapper
 
 
-class DBManager:
+class _Refresh:
+    """A refresh_reservations call in flight, awaited by concurrent callers."""
+
     def __init__(self):
-        self.connect_to_db_and_authenticate()
+        self.done = threading.Event()
+        self.error = None
+
+
+class DBManager:
+    def __init__(self, cache=None, snapshot_path=None, db=None):
+        # Local copy of the "sites" collection, kept in sync with our own writes
+        # and reconciled against the server update time of each site document.
+        # Both dicts are replaced rather than mutated, so sessions can share them.
+        self.reservations = {}
+        self.update_times = {}
+        self.prices = {}
+        self.prices_update_times = {}
+        self._rate_table = None
+        # Optional shared cache tier, see reservation_cache.py
+        self.cache = cache
+        self.cache_version = 0
+        # Optional on-disk snapshot used for instant cold starts
+        self.snapshot_path = snapshot_path
+        # Whether every site was loaded at least once, from a full scan or the snapshot
+        self._complete = False
+        self._lock = threading.RLock()
+        # Single-flight state of refresh_reservations
+        self._refresh_lock = threading.Lock()
+        self._refresh = None
+        self._last_refresh = float("-inf")
+        if db is None:
+            self.connect_to_db_and_authenticate()
+        else:
+            # Already connected client, e.g. a local stand-in
+            self.db = db
+            self.db_timestamp = dt.datetime.utcnow()
 
     def connect_to_db_and_authenticate(self, *args, **kwargs):
         self.db = connect_to_firebase_db_and_authenticate(*args, **kwargs)
         self.db_timestamp = dt.datetime.utcnow()
 
     def get_all_reservations(self) -> dict:
-        return self._get_all_objects_in_collection("sites")
+        update_times = {}
+        reservations = self._get_all_objects_in_collection("sites", update_times)
+        self._apply_sites(
+            {site: (data, update_times[site]) for site, data in reservations.items()}
+        )
+        self._complete = True
+        self._publish_to_cache(reservations.keys())
+        self._persist_snapshot()
+        return self.reservations
+
+    def get_cached_reservations(self) -> dict:
+        """Returns the local reservations, brought up to date with the shared cache.
+
+        Only the sites invalidated since the last sync are pulled from the cache,
+        which is trusted on its own only once it holds every reservable site.
+        Until then, the on-disk snapshot is loaded, published to the cache and
+        refreshed in the background, and Firestore is scanned only without one.
+
+        Returns:
+            dict: Nested dictionary of all reservation instances
+        """
+        if self.cache is not None:
+            self._sync_from_cache()
+        if not self._has_all_sites() and self._load_snapshot():
+            threading.Thread(target=self.refresh_reservations, args=(0,), daemon=True).start()
+        if not self._has_all_sites():
+            return self.get_all_reservations()
+        return self.reservations
+
+    def refresh_reservations(self, min_interval: float = MIN_REFRESH_INTERVAL) -> dict:
+        """Refreshes the reservations, sharing a single fetch between concurrent callers.
+
+        Callers arriving while a refresh is in flight wait for it instead of
+        starting their own, and get its error if it fails. A refresh completed
+        successfully less than min_interval seconds ago is reused as is.
+
+        Args:
+            min_interval (float, optional): Defaults to MIN_REFRESH_INTERVAL.
+
+        Returns:
+            dict: Nested dictionary of all reservation instances
+        """
+        with self._refresh_lock:
+            refresh = self._refresh
+            if refresh is None:
+                if time.monotonic() - self._last_refresh < min_interval:
+                    return self.reservations
+                refresh = self._refresh = _Refresh()
+                leader = True
+            else:
+                leader = False
+        if not leader:
+            refresh.done.wait()
+            if refresh.error is not None:
+                raise refresh.error
+            return self.reservations
+
+        try:
+            if self.reservations:
+                self.refresh_changed_sites()
+            else:
+                self.get_all_reservations()
+            self._refresh_prices()
+        except Exception as e:
+            refresh.error = e
+            raise
+        else:
+            with self._refresh_lock:
+                self._last_refresh = time.monotonic()
+        finally:
+            with self._refresh_lock:
+                self._refresh = None
+            refresh.done.set()
+        return self.reservations
+
+    def refresh_changed_sites(self) -> list:
+        """Fetches only the site documents updated since they were last read.
+
+        The update times of all site documents are listed without their fields,
+        then the changed documents are fetched in a single batch. Sites whose
+        document no longer exists are dropped.
+
+        Returns:
+            sites: Names of the sites that were refreshed or dropped.
+        """
+        server_times = self._get_update_times_in_collection("sites")
+        with self._lock:
+            changed = [
+                site
+                for site, update_time in server_times.items()
+                if self.update_times.get(site) is None
+                or self.update_times[site] < update_time
+            ]
+            removed = [site for site in self.reservations if site not in server_times]
+        if removed:
+            self._remove_sites(removed)
+            self._publish_removal_to_cache(removed)
+        if changed:
+            update_times = {}
+            sites = self._get_objects_in_collection("sites", changed, update_times)
+            self._apply_sites(
+                {site: (data, update_times[site]) for site, data in sites.items()}
+            )
+            self._publish_to_cache(changed)
+        if changed or removed:
+            self._persist_snapshot()
+        return changed + removed
 
     def get_all_daily_prices(self) -> dict:
-        all_prices = self._get_all_objects_in_collection("prices")
-        return all_prices['daily_prices']
-    
+        return dict(self._get_prices()['daily_prices'])
+
     def get_all_monthly_prices(self) -> dict:
-        all_prices = self._get_all_objects_in_collection("prices")
-        return all_prices['monthly_prices']
+        return dict(self._get_prices()['monthly_prices'])
+
+    def refresh_prices(self):
+        """Re-reads the price documents, e.g. before editing them."""
+        self._refresh_prices()
+
+    def get_rate_table(self) -> RateTable:
+        """Returns the rate table of the current prices, rebuilt only when they change."""
+        # May re-read the prices from Firestore, which must not hold the lock
+        self._get_prices()
+        with self._lock:
+            if self._rate_table is None:
+                self._rate_table = RateTable(
+                    self.prices['daily_prices'],
+                    self.prices['monthly_prices'],
+                    self._prices_version(),
+                )
+            return self._rate_table
 
     def get_sites_list(self) -> list:
         return self._get_all_object_ids_in_collection("sites")
 
     def get_reservations_for_site(self, site_name: str) -> dict:
-        return self._get_object_in_collection("sites", site_name)
-
-    def update_sites_daily_prices(self, prices_dict:dict):
-        return self._update_object_in_collection(
-            collection_name="prices",
-            object_name="daily_prices",
-            new_data=prices_dict
-        )
-    def update_sites_monthly_prices(self, prices_dict:dict):
-        return self._update_object_in_collection(
-            collection_name="prices",
-            object_name="monthly_prices",
-            new_data=prices_dict
+        update_times = {}
+        site_reservations = self._get_object_in_collection(
+            "sites", site_name, update_times
         )
+        self._apply_sites({site_name: (site_reservations, update_times[site_name])})
+        self._publish_to_cache([site_name])
+        return site_reservations
 
-    def add_reservation_to_site(self, site_name: str, reservation_data: dict):
-        return self._update_object_in_collection(
-            collection_name="sites",
-            object_name=site_name,
-            new_data=reservation_data,
-        )
+    def update_sites_daily_prices(self, prices_dict: dict) -> dt.datetime:
+        return self._update_prices("daily_prices", prices_dict)
+
+    def update_sites_monthly_prices(self, prices_dict: dict) -> dt.datetime:
+        return self._update_prices("monthly_prices", prices_dict)
+
+    def add_reservation_to_site(self, site_name: str, reservation_data: dict) -> dt.datetime:
+        """Writes a reservation and applies it to the local reservations.
+
+        The reservation is checked against the local copy of the site, and the
+        write is conditioned on the site document not having changed since that
+        copy was read. If it did, the site is re-read so the local copy is
+        reconciled, and the error is raised again.
+
+        Args:
+            site_name (str): String of the site to add the reservation to.
+            reservation_data (dict): Dictionary containing the reservation information.
 
-    def delete_reservation(self, site_name: str, reservation_key: str) -> dict:
+        Returns:
+            update_time: Server update time of the site document.
+        """
         try:
-            doc_ref = self.db.collection("sites").document(site_name)
-            doc = doc_ref.get() 
-            site_dict = doc.to_dict()
-            del site_dict[reservation_key]
-            doc_ref.set(site_dict)
-            return True
-        except:
-            return False
-    
+            return self._write_site(site_name, reservation_data, validate=True)
+        except FailedPrecondition:
+            self.get_reservations_for_site(site_name)
+            raise
+
+    def delete_reservation(self, site_name: str, reservation_key: str) -> dt.datetime:
+        """Deletes a reservation and removes it from the local reservations.
+
+        Args:
+            site_name (str): String of the site to remove the reservation from.
+            reservation_key (str): Reservation key, the starting date as a string.
+
+        Returns:
+            update_time: Server update time of the site document, None on failure.
+        """
+        for _ in range(2):
+            try:
+                return self._write_site(
+                    site_name, {reservation_key: firestore.DELETE_FIELD}
+                )
+            except FailedPrecondition:
+                # Site changed since our copy was read, reconcile and retry once
+                self.get_reservations_for_site(site_name)
+            except:
+                return None
+        return None
+
+    def add_reservations(self, reservations: dict) -> dt.datetime:
+        """Writes reservations on several sites in a single atomic batch.
+
+        Each site is written once, conditioned on its last known update time as
+        in add_reservation_to_site. If any site changed, nothing is written, the
+        sites are re-read and the error is raised again.
+
+        Args:
+            reservations (dict): Site name to the site's new reservations, keyed by start date.
+
+        Returns:
+            update_time: Server update time of the batch, None if it was empty.
+        """
+        for site_name in reservations:
+            if site_name not in self.update_times:
+                self.get_reservations_for_site(site_name)
+        with self._lock:
+            sites = {
+                site_name: dict(self.reservations.get(site_name) or {})
+                for site_name in reservations
+            }
+            last_update_times = {s: self.update_times.get(s) for s in reservations}
+        batch = self.db.batch()
+        for site_name, new_data in reservations.items():
+            for key, reservation in new_data.items():
+                if not is_reservation_possible(sites[site_name], {key: reservation}):
+                    raise ValueError(
+                        f"Reservation overlaps an existing one at site {site_name}."
+                    )
+                sites[site_name][key] = reservation
+            option = None
+            if last_update_times[site_name] is not None:
+                option = self.db.write_option(
+                    last_update_time=last_update_times[site_name]
+                )
+            ref = self.db.collection("sites").document(site_name)
+            batch.update(ref, new_data, option=option)
+        try:
+            write_results = batch.commit()
+        except FailedPrecondition:
+            for site_name in reservations:
+                self.get_reservations_for_site(site_name)
+            raise
+        update_times = {s: r.update_time for s, r in zip(reservations, write_results)}
+        self._apply_sites({s: (sites[s], update_times[s]) for s in update_times})
+        self._publish_to_cache(list(update_times))
+        self._persist_snapshot()
+        return max(update_times.values(), default=None)
+
     def validate_reservation_is_possible(self, site_name: str, reservation: dict) -> bool:
         """Verifies if a given reservation is possible and not overlapping with existing ones.
 
         Args:
-            db: Firebase database instance.
             site (str): String of the site to add the reservation to.
             reservation (dict): Dictionary containing the reservation information.
 
@@ -93,24 +337,213 @@ class DBManager:
             success: Boolean wether the addition is possible (True), or not (False).
         """
         reservations = self.get_reservations_for_site(site_name)
-        start = list(reservation.keys())[0]
-        end = list(reservation.values())[0]["end"]
-        for iter_start, vals in reservations.items():
-            iter_end = vals["end"]
-            cond1 = start >= iter_start and start <= iter_end
-            cond2 = end >= iter_start and end <= iter_end
-            if cond1 or cond2:
-                return False
+        return is_reservation_possible(reservations, reservation)
+
+    def _write_site(
+        self, site_name: str, new_data: dict, validate: bool = False
+    ) -> dt.datetime:
+        if site_name not in self.update_times:
+            self.get_reservations_for_site(site_name)
+        with self._lock:
+            site_reservations = dict(self.reservations.get(site_name) or {})
+            last_update_time = self.update_times.get(site_name)
+        if validate and not is_reservation_possible(site_reservations, new_data):
+            raise ValueError(f"Reservation overlaps an existing one at site {site_name}.")
+        update_time = self._update_object_in_collection(
+            collection_name="sites",
+            object_name=site_name,
+            new_data=new_data,
+            last_update_time=last_update_time,
+        )
+        for key, value in new_data.items():
+            if value is firestore.DELETE_FIELD:
+                site_reservations.pop(key, None)
+            else:
+                site_reservations[key] = value
+        self._apply_sites({site_name: (site_reservations, update_time)})
+        self._publish_to_cache([site_name])
+        self._persist_snapshot()
+        return update_time
+
+    def _apply_sites(self, sites: dict):
+        """Applies (reservations, update_time) pairs per site, keeping the newest."""
+        with self._lock:
+            reservations = dict(self.reservations)
+            update_times = dict(self.update_times)
+            for site, (site_reservations, update_time) in sites.items():
+                current = update_times.get(site)
+                if current is not None and update_time is not None and current > update_time:
+                    continue
+                reservations[site] = site_reservations
+                update_times[site] = update_time
+            self.reservations = reservations
+            self.update_times = update_times
+
+    def _remove_sites(self, site_names: list):
+        with self._lock:
+            reservations = dict(self.reservations)
+            update_times = dict(self.update_times)
+            for site in site_names:
+                reservations.pop(site, None)
+                update_times.pop(site, None)
+            self.reservations = reservations
+            self.update_times = update_times
+
+    def _publish_removal_to_cache(self, site_names: list):
+        # Deletions carry the current time so they win over older entries
+        if self.cache is None or not site_names:
+            return
+        update_time = format_update_time(dt.datetime.now(dt.timezone.utc))
+        self.cache.publish_sites(
+            {
+                site: dict(update_time=update_time, reservations=None, deleted=True)
+                for site in site_names
+            }
+        )
+
+    def _publish_to_cache(self, site_names):
+        if self.cache is None or not site_names:
+            return
+        with self._lock:
+            entries = {
+                site: dict(
+                    update_time=format_update_time(self.update_times.get(site)),
+                    reservations=self.reservations.get(site),
+                )
+                for site in site_names
+            }
+        self.cache.publish_sites(entries)
+
+    def _load_snapshot(self) -> bool:
+        if self.snapshot_path is None:
+            return False
+        try:
+            snapshot = read_snapshot(self.snapshot_path)
+        except Exception:
+            logger.exception("Could not read reservation snapshot.")
+            return False
+        if snapshot is None:
+            return False
+        reservations, update_times = snapshot
+        self._apply_sites(
+            {site: (data, update_times[site]) for site, data in reservations.items()}
+        )
+        self._complete = True
+        # Older entries never replace newer ones in the cache
+        self._publish_to_cache(reservations.keys())
         return True
 
+    def _persist_snapshot(self):
+        # Best effort, the snapshot is only a cache and must never fail a write.
+        # A partial copy synced from the cache must not replace a complete file.
+        if self.snapshot_path is None or not self._has_all_sites():
+            return
+        try:
+            with self._lock:
+                write_snapshot(self.reservations, self.update_times, self.snapshot_path)
+        except Exception:
+            logger.exception("Could not write reservation snapshot.")
+
+    def _has_all_sites(self) -> bool:
+        # The cache only holds the sites published since it was started
+        return self._complete or set(get_site_types()) <= set(self.reservations)
+
+    def _sync_from_cache(self):
+        version = self.cache.get_version()
+        if version <= self.cache_version:
+            return
+        site_names = self.cache.get_invalidations(self.cache_version)
+        entries = self.cache.get_sites(site_names)
+        self._remove_sites([s for s, e in entries.items() if e.get("deleted")])
+        self._apply_sites(
+            {
+                site: (entry["reservations"], parse_update_time(entry["update_time"]))
+                for site, entry in entries.items()
+                if not entry.get("deleted")
+            }
+        )
+        with self._lock:
+            self.cache_version = max(self.cache_version, version)
+
+    def _get_prices(self) -> dict:
+        if not self.prices or self._prices_invalidated():
+            self._refresh_prices()
+        return self.prices
+
+    def _prices_version(self) -> str:
+        return max(
+            (format_update_time(t) for t in self.prices_update_times.values()),
+            default="",
+        )
+
+    def _prices_invalidated(self) -> bool:
+        # Another replica published newer prices through the shared cache
+        if self.cache is None:
+            return False
+        return self.cache.get_prices_version() > self._prices_version()
+
+    def _refresh_prices(self):
+        update_times = {}
+        prices = self._get_all_objects_in_collection("prices", update_times)
+        with self._lock:
+            if update_times != self.prices_update_times:
+                self.prices = prices
+                self.prices_update_times = update_times
+                self._rate_table = None
+        self._publish_prices_to_cache()
+
+    def _publish_prices_to_cache(self):
+        if self.cache is not None:
+            self.cache.publish_prices_version(self._prices_version())
+
+    def _update_prices(self, object_name: str, prices_dict: dict) -> dt.datetime:
+        update_time = self._update_object_in_collection(
+            collection_name="prices", object_name=object_name, new_data=prices_dict
+        )
+        self._get_prices()
+        with self._lock:
+            prices = dict(self.prices)
+            prices[object_name] = {**prices.get(object_name, {}), **prices_dict}
+            self.prices = prices
+            self.prices_update_times = {
+                **self.prices_update_times,
+                object_name: update_time,
+            }
+            self._rate_table = None
+        self._publish_prices_to_cache()
+        return update_time
+
     @refresh_db
-    def _get_all_objects_in_collection(self, collection_name: str) -> dict:
+    def _get_all_objects_in_collection(
+        self, collection_name: str, update_times: dict = None
+    ) -> dict:
         ref = self.db.collection(collection_name)
         all_objects_dict = {}
         for obj in ref.stream():
             all_objects_dict[obj.id] = obj.to_dict()
+            if update_times is not None:
+                update_times[obj.id] = obj.update_time
         return all_objects_dict
 
+    @refresh_db
+    def _get_objects_in_collection(
+        self, collection_name: str, object_names: list, update_times: dict = None
+    ) -> dict:
+        refs = [self.db.collection(collection_name).document(o) for o in object_names]
+        objects_dict = {}
+        for obj in self.db.get_all(refs):
+            objects_dict[obj.id] = obj.to_dict()
+            if update_times is not None:
+                update_times[obj.id] = obj.update_time
+        return objects_dict
+
+    @refresh_db
+    def _get_update_times_in_collection(self, collection_name: str) -> dict:
+        # Projection on the document id only, no fields are transferred
+        ref = self.db.collection(collection_name)
+        query = ref.select([firestore.FieldPath.document_id()])
+        return {obj.id: obj.update_time for obj in query.stream()}
+
     @refresh_db
     def _create_new_object_in_collection(
         self, collection_name: str, object_name: str, data: dict
@@ -127,22 +560,29 @@ class DBManager:
         return object_names_list
 
     @refresh_db
-    def _get_object_in_collection(self, collection_name: str, object_name: str) -> dict:
+    def _get_object_in_collection(
+        self, collection_name: str, object_name: str, update_times: dict = None
+    ) -> dict:
         ref = self.db.collection(collection_name).document(object_name)
         obj = ref.get()  # Get data for document
+        if update_times is not None:
+            update_times[obj.id] = obj.update_time
         return obj.to_dict()
 
     @refresh_db
     def _update_object_in_collection(
-        self, collection_name: str, object_name: str, new_data: dict
-    ) -> dict:
-        data = self._get_object_in_collection(
-            collection_name=collection_name, object_name=object_name
-        )
-        data.update(new_data)
-        self._create_new_object_in_collection(
-            collection_name=collection_name, object_name=object_name, data=data
-        )
+        self,
+        collection_name: str,
+        object_name: str,
+        new_data: dict,
+        last_update_time: dt.datetime = None,
+    ) -> dt.datetime:
+        ref = self.db.collection(collection_name).document(object_name)
+        option = None
+        if last_update_time is not None:
+            option = self.db.write_option(last_update_time=last_update_time)
+        write_result = ref.update(new_data, option=option)
+        return write_result.update_time
 
     @refresh_db
     def _delete_object_in_collection(self, collection_name: str, object_name: str):
@@ -159,6 +599,12 @@ class DBManager:
             )
 
 
+@st.cache_resource
+def get_db_manager() -> DBManager:
+    """Returns the DBManager shared by every session of this process."""
+    return DBManager(cache=get_reservation_cache(), snapshot_path=get_snapshot_path())
+
+
 def connect_to_firebase_db_and_authenticate(
     local_auth_file: str = "firestore-key.json",
 ) -> object:
@@ -4,6 +4,8 @@ import json
 import os
 import streamlit as st
 
+from utils import is_reservation_possible
+
 
 def get_all_reservations(db) -> dict:
     """Returns the reservations for all sites in the database.
@@ -95,15 +97,7 @@ def validate_reservation_is_possible(db, site: str, reservation: dict) -> bool:
         success: Boolean wether the addition is possible (True), or not (False).
     """
     reservations = get_reservations_for_site(db, site)
-    start = list(reservation.keys())[0]
-    end = list(reservation.values())[0]["end"]
-    for iter_start, vals in reservations.items():
-        iter_end = vals["end"]
-        cond1 = start >= iter_start and start <= iter_end
-        cond2 = end >= iter_start and end <= iter_end
-        if cond1 or cond2:
-            return False
-    return True
+    return is_reservation_possible(reservations, reservation)
 
 
 def connect_to_firebase_db_and_authenticate(
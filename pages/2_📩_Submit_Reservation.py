@@ -1,20 +1,25 @@
 import streamlit as st
 import datetime as dt
 import time
-from db_manager import DBManager 
-from utils import get_reservable_sites
+from db_manager import get_db_manager
+from utils import debounce, get_reservable_sites
+from pricing import search_quotes
+from campground_map import (
+    BANNER_IMAGE,
+    BANNER_WIDTH,
+    PLAN_IMAGE,
+    PLAN_WIDTH,
+    get_downscaled_image,
+)
 
 if "db" not in st.session_state.keys():
-    db = DBManager()
-    st.session_state["db"] = db
+    st.session_state["db"] = get_db_manager()
 
 if "authenticated" not in st.session_state.keys():
     st.session_state["authenticated"] = False 
 
 st.sidebar.title("Reservation System")
 refresh = st.sidebar.button("Refresh Data")
-if refresh:
-    st.session_state["db"] = DBManager()
 st.sidebar.header("Administrators Login")
 
 if not st.session_state['authenticated']:
@@ -30,31 +35,50 @@ if not st.session_state['authenticated']:
 else:
     st.sidebar.success("Logged in as administrator.") 
 
-if "all_reservations" not in st.session_state.keys() or refresh:
-    with st.spinner("Loading database ..."):
-        st.session_state["db"] = DBManager()
-        st.session_state["all_reservations"] = st.session_state["db"].get_all_reservations()
+with st.spinner("Loading database ..."):
+    if refresh and debounce(st.session_state, "last_refresh"):
+        st.session_state["db"].refresh_reservations()
+    st.session_state["all_reservations"] = st.session_state[
+        "db"
+    ].get_cached_reservations()
 
 _, img_col, _ = st.columns((1, 2, 1))
 st.header("📩 Submit Reservation")
 st.warning("This section is still under development, and not functional.")
-img_col.image("playa_norte.png")
+img_col.image(get_downscaled_image(BANNER_IMAGE, BANNER_WIDTH))
 
 with st.expander("Campground Plan"):
-    st.image("campground.png")
+    st.image(get_downscaled_image(PLAN_IMAGE, PLAN_WIDTH))
 
-daily_prices_dict = st.session_state["db"].get_all_daily_prices()
-monthly_prices_dict = st.session_state["db"].get_all_monthly_prices()
+rate_table = st.session_state["db"].get_rate_table()
 
 st.subheader("Reservation Details")
 _, col11, _, col12, _ = st.columns((1, 4, 1, 8, 1))
 s_date = col11.date_input("Select Start Date", dt.datetime.now())
 e_date = col11.date_input("Select End Date", dt.datetime.now() + dt.timedelta(days=7))
 site_type = col12.selectbox("Select Site Type", ["A", "B", "C", "D", "E", "F"])
+site_names = get_reservable_sites()[f"{site_type} sites"]
+results = search_quotes(
+    rate_table, st.session_state["all_reservations"], site_names, [(s_date, e_date)]
+)
+available_sites = [r["site"] for r in results if r["available"]]
+quote = results[0]["quote"]
 with col12:
-    st.write("✅ Site available.")
-    st.write(f"Daily price: ", daily_prices_dict[site_type], "Pesos.")
-    st.write(f"Monthly price: ", monthly_prices_dict[site_type], "Pesos.")
+    if e_date <= s_date:
+        st.write("❌ Invalid dates, end date must be later than start date.")
+    elif available_sites:
+        st.write("✅ Site available:", ", ".join(available_sites))
+    else:
+        st.write("❌ No site of this type is available for these dates.")
+    st.write(f"Daily price: ", quote["daily_price"], "Pesos.")
+    st.write(f"Monthly price: ", quote["monthly_price"], "Pesos.")
+    if quote["nights"] > 0:
+        st.write(
+            f"Total for {quote['nights']} nights ({quote['months']} months, "
+            f"{quote['days']} days): ",
+            quote["total"],
+            "Pesos.",
+        )
     #st.write(f"Required deposit: ", 400, "USD.")
 site_type_clean = site_type[0]
 
@@ -1,22 +1,24 @@
+import logging
 import streamlit as st
 import datetime as dt
-import time
 import plotly.express as px
-from db_manager import DBManager
-from utils import get_reservable_sites
+from db_manager import get_db_manager
+from utils import debounce, get_reservable_sites, get_site_types
+from pricing import is_valid_price_update
+from allocation import assign_sites
+from campground_map import BANNER_IMAGE, BANNER_WIDTH, get_downscaled_image
 import pandas as pd
 
+logger = logging.getLogger(__name__)
+
 if "db" not in st.session_state.keys():
-    db = DBManager()
-    st.session_state["db"] = db
+    st.session_state["db"] = get_db_manager()
 
 if "authenticated" not in st.session_state.keys():
     st.session_state["authenticated"] = False
 
 st.sidebar.title("Reservation System")
 refresh = st.sidebar.button("Refresh Data")
-if refresh:
-    st.session_state["db"] = DBManager()
 st.sidebar.header("Administrators Login")
 
 if not st.session_state["authenticated"]:
@@ -32,22 +34,28 @@ if not st.session_state["authenticated"]:
 else:
     st.sidebar.success("Logged in as administrator.")
 
-if "all_reservations" not in st.session_state.keys() or refresh:
-    with st.spinner("Loading database ..."):
-        st.session_state["db"] = DBManager()
-        st.session_state["all_reservations"] = st.session_state[
-            "db"
-        ].get_all_reservations()
+with st.spinner("Loading database ..."):
+    if refresh and debounce(st.session_state, "last_refresh"):
+        st.session_state["db"].refresh_reservations()
+    st.session_state["all_reservations"] = st.session_state[
+        "db"
+    ].get_cached_reservations()
 
 _, img_col, _ = st.columns((1, 2, 1))
 st.header("🛠 Administration Panel")
-img_col.image("playa_norte.png")
+img_col.image(get_downscaled_image(BANNER_IMAGE, BANNER_WIDTH))
+
+# Result of the last write, kept across the rerun that follows it
+if "admin_message" in st.session_state.keys():
+    level, message = st.session_state.pop("admin_message")
+    getattr(st, level)(message)
 
 if st.session_state["authenticated"]:
     sites = get_reservable_sites()
     all_sites = []
     for v in sites.values():
         all_sites += list(v)
+    auto_assign_options = {f"Auto-assign ({k})": k.split(" ")[0] for k in sites}
 
     # CREATE USER DICT TO FILTER BY NAME
     user_dict = {}
@@ -158,7 +166,7 @@ if st.session_state["authenticated"]:
         e_date = col13.date_input(
             "Select End Date", dt.datetime.now() + dt.timedelta(7)
         )
-        site = col11.selectbox("Select Site", all_sites)
+        site = col11.selectbox("Select Site", list(auto_assign_options) + all_sites)
         _, col111, col112 = st.columns((1, 10, 10))
         name = col111.text_input("Input Name")
         color = col112.selectbox(
@@ -182,7 +190,23 @@ if st.session_state["authenticated"]:
             }
         }
         db = st.session_state["db"]
-        site_available = db.validate_reservation_is_possible(site, reservation)
+        if site in auto_assign_options:
+            request = dict(site_type=auto_assign_options[site], start=s_date, end=e_date)
+            # Sites are assigned from the session copy, which may be stale, so
+            # assign again without the sites found busy once re-read
+            candidate_sites = get_site_types()
+            while True:
+                site = assign_sites(
+                    [request], st.session_state["all_reservations"], candidate_sites
+                )[0]
+                if site is None or db.validate_reservation_is_possible(site, reservation):
+                    break
+                candidate_sites = {
+                    s: t for s, t in candidate_sites.items() if s != site
+                }
+            site_available = site is not None
+        else:
+            site_available = db.validate_reservation_is_possible(site, reservation)
         if name != "" and site_available and e_date > s_date:
             reservation_available = True
         else:
@@ -202,34 +226,123 @@ if st.session_state["authenticated"]:
                     name,
                     ".",
                 )
+                quote = db.get_rate_table().quote(get_site_types()[site], s_date, e_date)
+                st.write(
+                    f"Total for {quote['nights']} nights ({quote['months']} months, "
+                    f"{quote['days']} days): ",
+                    quote["total"],
+                    "Pesos.",
+                )
                 if col21.button("Add new reservation"):
                     try:
                         db.add_reservation_to_site(site, reservation)
-                        st.success("Reservation successfuly added !")
+                        st.session_state["admin_message"] = (
+                            "success",
+                            "Reservation successfuly added !",
+                        )
                     except:
-                        st.error("Failure - Unable to add reservation")
-                    with st.spinner("Refreshing database ..."):
-                        try:
-                            st.session_state["db"] = DBManager()
-                            st.session_state["all_reservations"] = st.session_state[
-                                "db"
-                            ].get_all_reservations()
-                        except:
-                            pass
+                        st.session_state["admin_message"] = (
+                            "error",
+                            "Failure - Unable to add reservation",
+                        )
+                    st.session_state["all_reservations"] = db.reservations
                     st.session_state["pending_submission"] = False
-                    time.sleep(1)
                     st.experimental_rerun()
         else:
             with col21:
                 if name == "":
                     st.write("❌ Missing reservation name.")
-                elif not site_available:
+                elif site is None and e_date > s_date:
+                    st.write("❌ No site of this type is available for these dates.")
+                elif not site_available and e_date > s_date:
                     st.write("❌ Invalid dates, this site is already busy.")
                 elif e_date <= s_date:
                     st.write(
                         "❌ Invalid dates, end date must be later than start date."
                     )
 
+    st.divider()
+    st.subheader("Bulk Assign Reservations")
+    st.info(
+        "Upload a CSV file with name, site_type (A to F or Others), start and end "
+        "columns, dates as YYYY-MM-DD. Sites are assigned to minimize gaps."
+    )
+    if "bulk_upload_key" not in st.session_state.keys():
+        st.session_state["bulk_upload_key"] = 0
+    bulk_file = st.file_uploader(
+        "Booking requests", type="csv", key=f"bulk_{st.session_state['bulk_upload_key']}"
+    )
+    if bulk_file is not None:
+        try:
+            requests_df = pd.read_csv(bulk_file, dtype={"name": str, "site_type": str})
+            missing_columns = {"name", "site_type", "start", "end"} - set(
+                requests_df.columns
+            )
+            if missing_columns:
+                raise ValueError(f"Missing columns: {sorted(missing_columns)}")
+            requests_df["name"] = requests_df["name"].fillna("").str.strip()
+            requests_df["site_type"] = requests_df["site_type"].fillna("").str.strip()
+            starts = pd.to_datetime(
+                requests_df["start"], format="%Y-%m-%d", errors="coerce"
+            )
+            ends = pd.to_datetime(requests_df["end"], format="%Y-%m-%d", errors="coerce")
+            requests_df["start"] = starts.dt.date
+            requests_df["end"] = ends.dt.date
+
+            # Flag invalid rows, only the valid ones are assigned
+            requests_df["error"] = ""
+            requests_df.loc[ends <= starts, "error"] = (
+                "End date must be later than start date."
+            )
+            requests_df.loc[starts.isna() | ends.isna(), "error"] = "Invalid dates."
+            requests_df.loc[
+                ~requests_df["site_type"].isin(auto_assign_options.values()), "error"
+            ] = "Unknown site type."
+            requests_df.loc[requests_df["name"] == "", "error"] = "Missing name."
+            valid_df = requests_df[requests_df["error"] == ""]
+            requests_df["site"] = None
+            requests_df.loc[valid_df.index, "site"] = assign_sites(
+                valid_df[["site_type", "start", "end"]].to_dict("records"),
+                st.session_state["all_reservations"],
+            )
+        except Exception as e:
+            st.error(f"Error - Could not read booking requests. {e}")
+            requests_df = None
+
+        if requests_df is not None:
+            st.dataframe(requests_df)
+            assigned_df = requests_df.dropna(subset=["site"])
+            st.write(len(assigned_df), "of", len(requests_df), "requests assigned.")
+            if (requests_df["error"] != "").any():
+                st.warning("Rows with an error are not assigned.")
+            if len(assigned_df) and st.button("Add assigned reservations"):
+                new_reservations = {}
+                for row in assigned_df.itertuples():
+                    new_reservations.setdefault(row.site, {})[
+                        row.start.strftime("%Y-%m-%d")
+                    ] = {
+                        "name": row.name,
+                        "start": row.start.strftime("%Y-%m-%d"),
+                        "end": row.end.strftime("%Y-%m-%d"),
+                        "duration": (row.end - row.start).days,
+                        "color": "blue",
+                    }
+                db = st.session_state["db"]
+                try:
+                    db.add_reservations(new_reservations)
+                    st.session_state["admin_message"] = (
+                        "success",
+                        f"{len(assigned_df)} reservations successfuly added !",
+                    )
+                except:
+                    st.session_state["admin_message"] = (
+                        "error",
+                        "Failure - Unable to add reservations",
+                    )
+                st.session_state["all_reservations"] = db.reservations
+                st.session_state["bulk_upload_key"] += 1
+                st.experimental_rerun()
+
     st.divider()
     st.subheader("Cancel Reservation")
     _, col21, _ = st.columns((1, 12, 2))
@@ -251,23 +364,28 @@ if st.session_state["authenticated"]:
         ]
         if key_to_delete:
             if st.button("Cancel Reservation"):
-                try:
-                    db = st.session_state["db"]
-                    db.delete_reservation(site, key_to_delete[0])
-                    st.warning("Reservation cancelled.")
-                except:
-                    st.error("Error - Could not cancel reservation.")
-                time.sleep(1)
-                st.session_state["db"] = DBManager()
-                st.session_state["all_reservations"] = st.session_state[
-                    "db"
-                ].get_all_reservations()
+                db = st.session_state["db"]
+                if db.delete_reservation(site, key_to_delete[0]):
+                    st.session_state["admin_message"] = (
+                        "warning",
+                        "Reservation cancelled.",
+                    )
+                else:
+                    st.session_state["admin_message"] = (
+                        "error",
+                        "Error - Could not cancel reservation.",
+                    )
+                st.session_state["all_reservations"] = db.reservations
                 st.experimental_rerun()
 
     st.divider()
     st.subheader("Modify Site Prices")
-    daily_prices_dict = st.session_state["db"].get_all_daily_prices()
-    monthly_prices_dict = st.session_state["db"].get_all_monthly_prices()
+    # Start from the prices on the server, another replica may have changed them
+    st.session_state["db"].refresh_prices()
+    current_daily_prices = st.session_state["db"].get_all_daily_prices()
+    current_monthly_prices = st.session_state["db"].get_all_monthly_prices()
+    daily_prices_dict = dict(current_daily_prices)
+    monthly_prices_dict = dict(current_monthly_prices)
     _, price_col_day, _, price_col_month, _ = st.columns((1, 4, 2, 4, 1))
 
     price_col_day.write("##### Daily prices (Pesos)")
@@ -279,27 +397,55 @@ if st.session_state["authenticated"]:
         monthly_prices_dict[k] = price_col_month.number_input(k, value=v, step=500)
 
     if price_col_day.button("Update Daily Prices"):
+        # Only write the prices edited here
+        changed_prices = {
+            k: v
+            for k, v in daily_prices_dict.items()
+            if v != current_daily_prices[k]
+        }
         try:
-            if len(daily_prices_dict) == 7:
-                st.session_state["db"].update_sites_daily_prices(daily_prices_dict)
-                price_col_day.success("Daily prices updated !")
+            if not changed_prices:
+                st.session_state["admin_message"] = ("info", "No price changed.")
+            elif is_valid_price_update(changed_prices, current_daily_prices):
+                st.session_state["db"].update_sites_daily_prices(changed_prices)
+                st.session_state["admin_message"] = ("success", "Daily prices updated !")
             else:
-                price_col_day.error("Error - Could not update prices.")
-        except:
-            price_col_day.error("Error - Could not update prices.")
-        time.sleep(2)
+                st.session_state["admin_message"] = (
+                    "error",
+                    "Error - Prices must be positive numbers.",
+                )
+        except Exception as e:
+            logger.exception("Could not update daily prices.")
+            st.session_state["admin_message"] = (
+                "error",
+                f"Error - Could not update prices. {e}",
+            )
         st.experimental_rerun()
 
     if price_col_month.button("Update Monthly Prices"):
+        # Only write the prices edited here
+        changed_prices = {
+            k: v
+            for k, v in monthly_prices_dict.items()
+            if v != current_monthly_prices[k]
+        }
         try:
-            if len(monthly_prices_dict) == 7:
-                st.session_state["db"].update_sites_monthly_prices(monthly_prices_dict)
-                price_col_month.success("Monthly prices updated !")
+            if not changed_prices:
+                st.session_state["admin_message"] = ("info", "No price changed.")
+            elif is_valid_price_update(changed_prices, current_monthly_prices):
+                st.session_state["db"].update_sites_monthly_prices(changed_prices)
+                st.session_state["admin_message"] = ("success", "Monthly prices updated !")
             else:
-                price_col_month.error("Error - Could not update prices.")
-        except:
-            price_col_month.error("Error - Could not update prices.")
-        time.sleep(2)
+                st.session_state["admin_message"] = (
+                    "error",
+                    "Error - Prices must be positive numbers.",
+                )
+        except Exception as e:
+            logger.exception("Could not update monthly prices.")
+            st.session_state["admin_message"] = (
+                "error",
+                f"Error - Could not update prices. {e}",
+            )
         st.experimental_rerun()
 
 else:
@@ -0,0 +1,94 @@
+import datetime as dt
+
+from utils import get_site_types, is_reservation_possible
+
+NIGHTS_PER_MONTH = 30
+
+
+class RateTable:
+    """Daily and monthly prices per site type, as stored in the "prices" collection.
+
+    Instances are immutable and tagged with the version of the price documents
+    they were built from, so prices computed from them can be cached safely.
+    """
+
+    def __init__(self, daily_prices: dict, monthly_prices: dict, version: str = ""):
+        self.daily_prices = dict(daily_prices)
+        self.monthly_prices = dict(monthly_prices)
+        self.version = version
+        # Memoised prices, keyed by (site_type, nights)
+        self._prices = {}
+
+    def quote(self, site_type: str, start: dt.date, end: dt.date) -> dict:
+        """Prices a stay as whole months at the monthly rate plus remaining nights.
+
+        Args:
+            site_type (str): Price key of the site, e.g. "A" or "Others".
+            start (dt.date): Arrival date.
+            end (dt.date): Departure date.
+
+        Returns:
+            quote: Dictionary with the nights, months and days breakdown, the
+                rates used and the total, in Pesos.
+        """
+        nights = (end - start).days
+        quote = dict(self._price(site_type, max(nights, 0)))
+        quote.update(site_type=site_type, start=start, end=end)
+        return quote
+
+    def _price(self, site_type: str, nights: int) -> dict:
+        key = (site_type, nights)
+        if key not in self._prices:
+            self._prices[key] = self._compute_price(site_type, nights)
+        return self._prices[key]
+
+    def _compute_price(self, site_type: str, nights: int) -> dict:
+        months, days = divmod(nights, NIGHTS_PER_MONTH)
+        daily_price = self.daily_prices[site_type]
+        monthly_price = self.monthly_prices[site_type]
+        return dict(
+            nights=nights,
+            months=months,
+            days=days,
+            daily_price=daily_price,
+            monthly_price=monthly_price,
+            total=months * monthly_price + days * daily_price,
+            version=self.version,
+        )
+
+
+def search_quotes(
+    rate_table: RateTable, all_reservations: dict, site_names: list, stays: list
+) -> list:
+    """Checks availability and prices every candidate site for every stay in one pass.
+
+    Args:
+        rate_table (RateTable): Rates to price the stays with.
+        all_reservations (dict): Nested dictionary of all reservation instances.
+        site_names (list): Candidate sites.
+        stays (list): (start, end) date tuples.
+
+    Returns:
+        results: One dictionary per (site, stay) with the site, its availability
+            and its quote, in the order of the stays then the sites.
+    """
+    site_types = get_site_types()
+    results = []
+    for start, end in stays:
+        reservation = {
+            start.strftime("%Y-%m-%d"): {"end": end.strftime("%Y-%m-%d")}
+        }
+        for site in site_names:
+            available = end > start and is_reservation_possible(
+                all_reservations.get(site), reservation
+            )
+            quote = rate_table.quote(site_types[site], start, end)
+            results.append(dict(site=site, available=available, quote=quote))
+    return results
+
+
+def is_valid_price_update(prices_dict: dict, current_prices: dict) -> bool:
+    """Verifies that a price update only sets current site types, with positive prices."""
+    return set(prices_dict) <= set(current_prices) and all(
+        isinstance(v, (int, float)) and v > 0 for v in prices_dict.values()
+    )
@@ -0,0 +1,218 @@
+import datetime as dt
+import json
+import os
+import threading
+
+UPDATE_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+MAX_INVALIDATION_EVENTS = 500
+
+_PUBLISH_PRICES_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if (not current) or current < ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[1])
+    redis.call('PUBLISH', KEYS[2], cjson.encode({prices = ARGV[1]}))
+end
+"""
+
+# Merges per-site payloads keeping the newest update time, bumps the snapshot
+# version and records/publishes an invalidation event, all in one round trip.
+_PUBLISH_SCRIPT = """
+local changed = {}
+for i = 2, #ARGV, 3 do
+    local site, update_time, payload = ARGV[i], ARGV[i + 1], ARGV[i + 2]
+    local current = redis.call('HGET', KEYS[2], site)
+    if (not current) or current < update_time then
+        redis.call('HSET', KEYS[1], site, payload)
+        redis.call('HSET', KEYS[2], site, update_time)
+        table.insert(changed, site)
+    end
+end
+if #changed == 0 then
+    return tonumber(redis.call('GET', KEYS[3]) or '0')
+end
+local version = redis.call('INCR', KEYS[3])
+local event = cjson.encode({version = version, sites = changed})
+redis.call('LPUSH', KEYS[4], event)
+redis.call('LTRIM', KEYS[4], 0, tonumber(ARGV[1]) - 1)
+redis.call('PUBLISH', KEYS[5], event)
+return version
+"""
+
+
+def format_update_time(update_time: dt.datetime) -> str:
+    """Formats a server update time as a fixed-width, sortable UTC string."""
+    if update_time is None:
+        return ""
+    if update_time.tzinfo is not None:
+        update_time = update_time.astimezone(dt.timezone.utc)
+    return update_time.strftime(UPDATE_TIME_FORMAT)
+
+
+def parse_update_time(update_time: str) -> dt.datetime:
+    """Parses a string produced by format_update_time back to an aware datetime."""
+    if not update_time:
+        return None
+    return dt.datetime.strptime(update_time, UPDATE_TIME_FORMAT).replace(
+        tzinfo=dt.timezone.utc
+    )
+
+
+class LocalReservationCache:
+    """In-process reservation cache, a stand-in for the shared Redis tier.
+
+    Site entries are stored as {"update_time": str, "reservations": dict} and
+    each publish that changes at least one site bumps the snapshot version and
+    records an invalidation event listing the changed sites.
+    """
+
+    def __init__(self, max_events: int = MAX_INVALIDATION_EVENTS):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._sites = {}
+        self._events = []
+        self._max_events = max_events
+        self._prices_version = ""
+
+    def get_version(self) -> int:
+        return self._version
+
+    def get_prices_version(self) -> str:
+        return self._prices_version
+
+    def publish_prices_version(self, prices_version: str):
+        """Publishes the latest update time of the price documents, keeping the newest."""
+        with self._lock:
+            self._prices_version = max(self._prices_version, prices_version)
+
+    def get_sites(self, site_names: list = None) -> dict:
+        with self._lock:
+            if site_names is None:
+                return dict(self._sites)
+            return {s: self._sites[s] for s in site_names if s in self._sites}
+
+    def get_invalidations(self, since_version: int) -> list:
+        """Returns the sites changed after a given version.
+
+        Returns:
+            sites: List of site names, None if the events since that version
+                are no longer all retained and a full snapshot is needed.
+        """
+        with self._lock:
+            if since_version >= self._version:
+                return []
+            events = [e for e in self._events if e["version"] > since_version]
+            if not events or events[0]["version"] != since_version + 1:
+                return None
+            return sorted({site for e in events for site in e["sites"]})
+
+    def publish_sites(self, sites: dict) -> int:
+        """Publishes site entries, keeping the newest update time per site.
+
+        Args:
+            sites (dict): Site name to {"update_time": str, "reservations": dict}.
+
+        Returns:
+            version: Snapshot version after the publish.
+        """
+        with self._lock:
+            changed = []
+            for site, entry in sites.items():
+                current = self._sites.get(site)
+                if current is None or current["update_time"] < entry["update_time"]:
+                    self._sites[site] = entry
+                    changed.append(site)
+            if changed:
+                self._version += 1
+                self._events.append(dict(version=self._version, sites=changed))
+                del self._events[: -self._max_events]
+            return self._version
+
+
+class RedisReservationCache:
+    """Reservation cache shared by every replica through a Redis-compatible store.
+
+    Requires the optional `redis` package. Invalidation events are kept in a
+    capped list and also published on a pub/sub channel.
+    """
+
+    def __init__(self, url: str, prefix: str = "playa_norte:reservations"):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.sites_key = prefix + ":sites"
+        self.update_times_key = prefix + ":update_times"
+        self.version_key = prefix + ":version"
+        self.events_key = prefix + ":events"
+        self.channel = prefix + ":invalidations"
+        self.prices_version_key = prefix + ":prices_version"
+        self._publish = self.client.register_script(_PUBLISH_SCRIPT)
+        self._publish_prices = self.client.register_script(_PUBLISH_PRICES_SCRIPT)
+
+    def get_version(self) -> int:
+        return int(self.client.get(self.version_key) or 0)
+
+    def get_prices_version(self) -> str:
+        return self.client.get(self.prices_version_key) or ""
+
+    def publish_prices_version(self, prices_version: str):
+        self._publish_prices(
+            keys=[self.prices_version_key, self.channel], args=[prices_version]
+        )
+
+    def get_sites(self, site_names: list = None) -> dict:
+        if site_names is None:
+            raw = self.client.hgetall(self.sites_key)
+        elif site_names:
+            values = self.client.hmget(self.sites_key, site_names)
+            raw = {s: v for s, v in zip(site_names, values) if v is not None}
+        else:
+            raw = {}
+        return {site: json.loads(payload) for site, payload in raw.items()}
+
+    def get_invalidations(self, since_version: int) -> list:
+        version = self.get_version()
+        if since_version >= version:
+            return []
+        events = [
+            json.loads(e)
+            for e in self.client.lrange(self.events_key, 0, version - since_version - 1)
+        ]
+        events = [e for e in events if e["version"] > since_version]
+        if not events or min(e["version"] for e in events) != since_version + 1:
+            return None
+        return sorted({site for e in events for site in e["sites"]})
+
+    def publish_sites(self, sites: dict) -> int:
+        args = [MAX_INVALIDATION_EVENTS]
+        for site, entry in sites.items():
+            args += [site, entry["update_time"], json.dumps(entry)]
+        if not sites:
+            return self.get_version()
+        keys = [
+            self.sites_key,
+            self.update_times_key,
+            self.version_key,
+            self.events_key,
+            self.channel,
+        ]
+        return int(self._publish(keys=keys, args=args))
+
+
+def get_reservation_cache(url: str = None) -> object:
+    """Returns the shared reservation cache configured for this deployment.
+
+    Args:
+        url (str, optional): "redis://..." for a shared store, "memory://" for the
+            in-process stand-in. Defaults to the RESERVATION_CACHE_URL variable.
+
+    Returns:
+        cache: Reservation cache, None when no shared cache is configured.
+    """
+    url = url or os.environ.get("RESERVATION_CACHE_URL", "")
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisReservationCache(url)
+    if url.startswith("memory://"):
+        return LocalReservationCache()
+    if url:
+        raise ValueError(f"Unsupported reservation cache url: {url}")
+    return None
@@ -0,0 +1,110 @@
+import datetime as dt
+import json
+import os
+
+import pyarrow as pa
+
+SNAPSHOT_FILE = "reservations_snapshot.arrow"
+SNAPSHOT_FORMAT_VERSION = "1"
+# Typed columns of the snapshot, values of another type go to the "extra" column
+RESERVATION_FIELDS = {
+    "start": str,
+    "end": str,
+    "name": str,
+    "duration": int,
+    "color": str,
+}
+
+# One row per reservation, plus one row with a null key for sites without any.
+SNAPSHOT_SCHEMA = pa.schema(
+    [
+        ("site", pa.string()),
+        ("update_time", pa.timestamp("us", tz="UTC")),
+        ("key", pa.string()),
+        ("start", pa.string()),
+        ("end", pa.string()),
+        ("name", pa.string()),
+        ("duration", pa.int64()),
+        ("color", pa.string()),
+        ("extra", pa.string()),  # JSON of any other reservation field
+    ]
+)
+
+
+def get_snapshot_path() -> str:
+    return os.environ.get("RESERVATION_SNAPSHOT_FILE", SNAPSHOT_FILE)
+
+
+def write_snapshot(reservations: dict, update_times: dict, path: str = None):
+    """Writes the reservations to a versioned Arrow IPC file.
+
+    The file is written next to its destination and then renamed over it, so
+    readers memory-mapping the previous snapshot are never handed a partial file.
+
+    Args:
+        reservations (dict): Nested dictionary of all reservation instances.
+        update_times (dict): Server update time of each site document.
+        path (str, optional): Snapshot file. Defaults to get_snapshot_path().
+    """
+    path = path or get_snapshot_path()
+    columns = {name: [] for name in SNAPSHOT_SCHEMA.names}
+    for site, site_reservations in reservations.items():
+        items = sorted((site_reservations or {}).items()) or [(None, {})]
+        for key, reservation in items:
+            typed = {
+                k: v
+                for k, v in reservation.items()
+                if k in RESERVATION_FIELDS
+                and type(v) is RESERVATION_FIELDS[k]
+            }
+            extra = {k: v for k, v in reservation.items() if k not in typed}
+            columns["site"].append(site)
+            columns["update_time"].append(update_times.get(site))
+            columns["key"].append(key)
+            for field in RESERVATION_FIELDS:
+                columns[field].append(typed.get(field))
+            columns["extra"].append(json.dumps(extra, default=str) if extra else None)
+
+    metadata = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "written_at": dt.datetime.utcnow().isoformat(),
+    }
+    table = pa.table(columns, schema=SNAPSHOT_SCHEMA.with_metadata(metadata))
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str = None) -> tuple:
+    """Memory-maps a snapshot written by write_snapshot.
+
+    Args:
+        path (str, optional): Snapshot file. Defaults to get_snapshot_path().
+
+    Returns:
+        snapshot: (reservations, update_times) dictionaries, None if the file does
+            not exist or was written with another format version.
+    """
+    path = path or get_snapshot_path()
+    if not os.path.exists(path):
+        return None
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    metadata = table.schema.metadata or {}
+    if metadata.get(b"format_version") != SNAPSHOT_FORMAT_VERSION.encode():
+        return None
+
+    reservations, update_times = {}, {}
+    for row in table.to_pylist():
+        site = row["site"]
+        site_reservations = reservations.setdefault(site, {})
+        update_times[site] = row["update_time"]
+        if row["key"] is None:
+            continue
+        reservation = {f: row[f] for f in RESERVATION_FIELDS if row[f] is not None}
+        if row["extra"]:
+            reservation.update(json.loads(row["extra"]))
+        site_reservations[row["key"]] = reservation
+    return reservations, update_times
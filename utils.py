@@ -1,4 +1,6 @@
+import datetime as dt
 import json
+import time
 
 
 def get_reservable_sites():
@@ -6,3 +8,70 @@ def get_reservable_sites():
         sites_dict = json.load(f)
 
     return sites_dict['reservable_sites']
+
+
+def get_site_types() -> dict:
+    """Maps each reservable site to its site type, the key of its prices."""
+    sites = get_reservable_sites()
+    return {
+        site: site_type.split(" ")[0]
+        for site_type, site_names in sites.items()
+        for site in site_names
+    }
+
+
+def get_site_coordinates():
+    with open("site_coordinates.json", "r") as f:
+        coordinates_dict = json.load(f)
+
+    return coordinates_dict['site_coordinates']
+
+
+def debounce(session_state, key: str, seconds: float = 3) -> bool:
+    """Returns True at most once every `seconds` for a given session state key."""
+    now = time.monotonic()
+    if now - session_state.get(key, float("-inf")) < seconds:
+        return False
+    session_state[key] = now
+    return True
+
+
+def get_occupied_sites(all_reservations: dict, date: dt.date) -> set:
+    """Returns the sites occupied on the night of a given date.
+
+    Args:
+        all_reservations (dict): Nested dictionary of all reservation instances.
+        date (dt.date): Night to check, a guest leaving on this date frees the site.
+
+    Returns:
+        occupied: Set of site names with a reservation covering the night.
+    """
+    day = date.strftime("%Y-%m-%d")
+    occupied = set()
+    for site, reservations in all_reservations.items():
+        for start, reservation in (reservations or {}).items():
+            if start <= day < reservation["end"]:
+                occupied.add(site)
+                break
+    return occupied
+
+
+def is_reservation_possible(reservations: dict, reservation: dict) -> bool:
+    """Verifies if a reservation does not overlap any of a site's reservations.
+
+    Reservations occupy the nights from their start date up to, but excluding,
+    their end date, so a site can be booked again on the day a guest leaves.
+
+    Args:
+        reservations (dict): Existing reservations of the site, keyed by start date.
+        reservation (dict): Dictionary containing the reservation information.
+
+    Returns:
+        success: Boolean wether the addition is possible (True), or not (False).
+    """
+    start = list(reservation.keys())[0]
+    end = list(reservation.values())[0]["end"]
+    for iter_start, vals in (reservations or {}).items():
+        if start < vals["end"] and end > iter_start:
+            return False
+    return True